@@ -92,7 +92,7 @@ if (cat /proc/device-tree/model | grep -q "Raspberry Pi");
 
     # pip3 install
     echo "Installing needed libraries...";
-    if (pip3 install Adafruit-SSD1306 Adafruit_BBIO gps pytz RPi.GPIO pyserial pillow flask gpiozero requests);
+    if (pip3 install Adafruit-SSD1306 Adafruit_BBIO gpsd-py3 pytz RPi.GPIO pyserial pillow flask gpiozero requests numpy);
         then 
         echo "Finished installing libraries.";
     else
@@ -21,12 +21,13 @@
 # SOFTWARE.
 
 import datetime
+import functools
+import socket
 import subprocess
 import threading
 import time
 
 import Adafruit_SSD1306
-import requests
 import serial
 from gpiozero import Button
 from PIL import Image, ImageDraw, ImageFont
@@ -36,6 +37,9 @@ BUTTON_SH_PIN = 18
 CMD_BIKE_MODE = "python3 raspberrypi/bike_mode.py 2>> errors.txt && printf \"Happened at $(date)\\n\\n\" >> errors.txt;"
 CMD_SERVER_MODE = "python3 raspberrypi/server_mode.py 2>> errors.txt && printf \"Happened at $(date)\\n\\n\" >> errors.txt;"
 
+# bike/server mode processes that are running, terminated on shutdown
+children = []
+
 class InitiationError(Exception):
     """
     This error is raised if could not initialize OLED or Arduino.
@@ -62,7 +66,7 @@ def handle_bike_mode() -> None:
 
     while True:
         # using subprocess instead of import so an error would not exit out of the whole program and the process would be easier to kill
-        subprocess.call(CMD_BIKE_MODE.split())
+        _run_child(CMD_BIKE_MODE)
 
         # if exits out here, means that OS error happened/Arduino disc or OLED disc
         try:
@@ -85,9 +89,7 @@ def handle_server_mode() -> None:
     global display, img, draw, font
 
     # checks for internet connection in order to enter server mode
-    try:
-        requests.get("https://google.com")
-
+    if (_have_internet(int(time.time()//30))):
         # display the pi IP as website
         website_name = _get_pi_ip()
 
@@ -99,8 +101,8 @@ def handle_server_mode() -> None:
         time.sleep(1)
 
         # using subprocess instead of import so an error would not exit out of the whole program and the process would be easier to kill
-        subprocess.call(CMD_SERVER_MODE.split())
-    except requests.exceptions.ConnectionError:
+        _run_child(CMD_SERVER_MODE)
+    else:
         # enter bike mode if no internet connection
 
         draw.rectangle((0, 0, 128, 128), fill=0)
@@ -114,21 +116,26 @@ def handle_server_mode() -> None:
         return
 
 def shutdown_button() -> None:
-    global display, img, draw, font
-
     # wait 30 seconds so the button wouldn't interfere with any of the setup stuff
     time.sleep(30)
 
     # shuts down pi when this is pressed
-
+    # callback only sets the event, so extra presses/bounces cannot start shutdown again
+    # waiting here also keeps the program alive after main() is done so the button still works
+    shutdown_pressed = threading.Event()
     sh_b = Button(BUTTON_SH_PIN)
-    sh_b.wait_for_press()
+    sh_b.when_pressed = shutdown_pressed.set
+    shutdown_pressed.wait()
+    sh_b.when_pressed = None
+
+    _do_shutdown()
+
+def _do_shutdown() -> None:
+    global display, img, draw, font
 
     # stop all sub programs
-    STOP_CMD_BK = "pkill -f raspberrypi/bike_mode.py"
-    STOP_CMD_SV = "pkill -f raspberrypi/server_mode.py"
-    subprocess.call(STOP_CMD_BK.split())
-    subprocess.call(STOP_CMD_SV.split())
+    for child in list(children):
+        child.terminate()
 
     time.sleep(1)
 
@@ -143,38 +150,72 @@ def shutdown_button() -> None:
     POWER_OFF_CMD = "sudo shutdown -h now"
     subprocess.call(POWER_OFF_CMD.split())
 
-def _check_components() -> bool:
+def _run_child(cmd: str) -> None:
+    """
+    Runs a mode's program and waits for it to exit, keeping track of it so it can be stopped on shutdown.
+    """
+
+    child = subprocess.Popen(cmd.split())
+    children.append(child)
+    try:
+        child.wait()
+    finally:
+        children.remove(child)
+
+def _check_components() -> "tuple[str, Adafruit_SSD1306.SSD1306_128_64]":
     """
     Checks that all components are connected properly before starting the program.
+    Returns which component failed ("" if none did) and the initialized display so it can be reused.
     """
 
+    display = None
+
     try:
         # check display
         display = Adafruit_SSD1306.SSD1306_128_64(rst=None)
         display.begin()
 
         # check serial port
+        # closed afterwards since bike mode opens the port in its own process
         pt_f = open("raspberrypi/port", 'r')
         pt = pt_f.read().strip()
         ser = serial.Serial(pt, 115200)
         ser.flush()
+        ser.close()
         pt_f.close()
 
     except OSError as e:
         if (e.errno == 2):
             print("Serial port could not be opened.")
-            return "Serial port"
+            return "Serial port", display
         elif (e.errno == 121):
             print("OLED could not be initialized.")
-            return "OLED"
-        return "Something"
+            return "OLED", display
+        return "Something", display
 
-    return ""
+    return "", display
+
+@functools.lru_cache(maxsize=4)
+def _have_internet(bucket: int) -> bool:
+    """
+    Checks for an internet connection by opening a TCP connection to a DNS server.
+    bucket is a coarse timestamp so the result is only reused for a short while.
+    """
+
+    try:
+        conn = socket.create_connection(("8.8.8.8", 53), 1)
+        conn.close()
+        return True
+    except OSError:
+        return False
 
 def _get_pi_ip() -> str:
-    s_p = subprocess.Popen("hostname -I".split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    output, err = s_p.communicate()
-    return output.decode("utf-8").rstrip()
+    # timeout so the setup screen does not hang if hostname does
+    try:
+        s_p = subprocess.run(["hostname", "-I"], capture_output=True, text=True, timeout=1)
+        return s_p.stdout.split()[0]
+    except (subprocess.SubprocessError, OSError, IndexError):
+        return "127.0.0.1"
 
 def main() -> None:
     global display, img, draw, font, b
@@ -183,7 +224,7 @@ def main() -> None:
 
     try:
         try:
-            _s = _check_components()
+            _s, display = _check_components()
             if (_s != ""):
                 raise InitiationError(1, which=_s)
         except InitiationError as e:
@@ -197,11 +238,7 @@ def main() -> None:
 
         mode = None
 
-        # init display
-        display = Adafruit_SSD1306.SSD1306_128_64(rst=None)
-        display.begin()
-        time.sleep(2)
-
+        # display was already initialized when checking components
         display.clear()
         display.display()
         time.sleep(1)
@@ -223,10 +260,16 @@ def main() -> None:
         b = Button(BUTTON_PIN)
 
         # wait 5 seconds for user to press button, otherwise enter bike mode
-        b.wait_for_press(timeout=5)
+        pressed = threading.Event()
+        b.when_pressed = pressed.set
+        # no edge is seen if the button was already held down
+        if (b.is_pressed):
+            pressed.set()
+        pressed.wait(timeout=5)
+        b.when_pressed = None
 
         # display if button pressed/button not pressed
-        if (b.is_pressed):
+        if (pressed.is_set()):
             mode = "server"
         else:
             mode = "bike"
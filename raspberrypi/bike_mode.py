@@ -21,8 +21,8 @@
 # SOFTWARE.
 
 import datetime
+import functools
 import json
-import math
 import os
 import subprocess
 import sys
@@ -30,22 +30,56 @@ import threading
 import time
 import traceback
 import typing as t
-from copy import deepcopy
 
 import Adafruit_SSD1306
-import gps
+import gpsd
+import numpy as np
 import pytz
 import RPi.GPIO as GPIO
 import serial
 from PIL import Image, ImageDraw, ImageFont
 
+# orjson is faster and works on bytes directly, but is not always available on the Pi
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # config data sent to Arduino during setup and other cfg data
-cfg_file = open("raspberrypi/cfg.json", 'r')
-cfg_ard = json.load(cfg_file)
-cfg = deepcopy(cfg_ard)
+with open("raspberrypi/cfg.json", 'r') as cfg_file:
+    cfg = json.load(cfg_file)
 cur_tz = cfg["TMZ"]
-del cfg_ard["24H"], cfg_ard["TMZ"]
-cfg_file.close()
+cfg_ard = {k: v for k, v in cfg.items() if k not in ("24H", "TMZ")}
+
+# display formats only depend on cfg, so work them out once
+# dd-mm or mm-dd
+_DAYFMT = "%d-%m " if (cfg["DTM"] == 1) else "%m/%d "
+
+# _DATE_X is to shift to account for lack of AM/PM
+# 23:00 or 11:00PM
+if (cfg["24H"] == 1):
+    _TMFMT = "%H:%M"
+    _DATE_X = 40
+else:
+    _TMFMT = "%I:%M%p"
+    _DATE_X = 30
+_DTFMT = _DAYFMT + _TMFMT
+
+# one encoder reused for everything sent to Arduino, compact to send less over serial
+_ENC = json.JSONEncoder(separators=(",", ":"), check_circular=False).encode
+
+# both take/return bytes so serial data does not need to be decoded/encoded
+if (orjson is not None):
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+else:
+    _loads = json.loads
+
+    def _dumps(obj: dict) -> bytes:
+        return _ENC(obj).encode("utf-8")
+
+# cfg_ard never changes, so only encode it once
+_CFG_ARD_JSON = _dumps(cfg_ard) + b"\n"
 
 # data sent to Arduino during loop
 send = {
@@ -63,24 +97,39 @@ tracking = 0  # 0 = stopped, 1 = paused, 2 = tracking
 wastracking = False # continues tracking even if disconnected
 prevbstate1 = False
 prevbstate2 = False
-prevTimeEpoch = 0
+prevTimeNs = 0
 
 fileName = "ERROR"
 msg = "ERROR"
+# file currently being tracked to, kept open instead of reopening for each point
+track_file = None
 
 # interval of plotting data during tracking
 INTERVAL = 2
+INTERVAL_NS = INTERVAL*1_000_000_000
 
-# what to put onto disp
-disp_data_g = {
+# what is displayed when there is no GPS data, copied instead of being rebuilt every loop
+_DISPLAY_TEMPLATE = {
     "speed": 0,
     "unit": cfg_ard["UNT"],
     "datetime": datetime.datetime(1970, 1, 1, 0, 0, 0),
     "mode": 'D',
     "track": ''
 }
+
+# what to put onto disp
+disp_data_g = _DISPLAY_TEMPLATE.copy()
 # sync LED panel speed to OLED speed because OLED is slow and cannot do other way around
 oled_speed = 0
+# last frame sent to OLED, so the same frame is not sent again
+last_frame = b""
+# when the last frame was sent, frame is still sent after this long so a disconnected OLED is noticed
+last_frame_time = 0.0
+FRAME_REFRESH = 3
+
+# time zone objects are expensive to build, so only build each one once
+_TZ_CACHE = functools.lru_cache(maxsize=8)(pytz.timezone)
+_UTC = pytz.utc
 
 # Arduino serial port
 port_file = open("raspberrypi/port", 'r')
@@ -99,27 +148,43 @@ def err(ex_type, value, tb):
 
 def get_gps_data() -> None:
     """
-    Thread that gets positional, time, and speed data from GPS since it is blocking
+    Thread that polls GPSD for positional, time, and speed data
     """
 
     global curdata
 
-    session = gps.gps("localhost")
-    session.stream(gps.WATCH_ENABLE | gps.WATCH_NEWSTYLE)
+    connected = False
 
     while True:
         try:
-            report = session.next()
-            if (report["class"] == "TPV"):
-                curdata = report
-                # print(curdata)
-        except KeyError:
-            pass
+            if (not connected):
+                gpsd.connect()
+                connected = True
+
+            p = gpsd.get_current()
+            if (p.mode >= 2 and p.time):
+                curdata = {
+                    "mode": p.mode,
+                    "time": p.time,
+                    "lat": p.lat,
+                    "lon": p.lon,
+                    "speed": p.hspeed
+                }
+            else:
+                # no fix yet, mode below 2 so it is treated as disconnected
+                curdata = {"mode": 1}
         except KeyboardInterrupt:
             quit()
-        except StopIteration:
-            session = None
-            print("GPSD has terminated")
+        except Exception:
+            # GPS not active or GPSD could not be reached, try to connect again
+            curdata = {}
+            connected = False
+            print("Could not get data from GPSD", file=sys.stderr)
+            time.sleep(1)
+            continue
+
+        # GPS only updates once a second
+        time.sleep(0.5)
 
 
 # converts dt as str to time zone
@@ -127,14 +192,23 @@ def _conv_tmz(dt: t.Union[str, datetime.datetime], fmt: t.Union[str, None], tmz:
     d_temp = None
     if (isinstance(dt, str)):
         d_temp = datetime.datetime.strptime(
-            dt, fmt).replace(tzinfo=pytz.utc)
+            dt, fmt).replace(tzinfo=_UTC)
     else:
-        d_temp = dt.replace(tzinfo=pytz.utc)
+        d_temp = dt.replace(tzinfo=_UTC)
 
-    timezone = pytz.timezone(tmz)
+    timezone = _TZ_CACHE(tmz)
     d_localized = d_temp.astimezone(timezone)
     return d_localized
 
+def _open_track_file() -> None:
+    global fileName, track_file
+
+    if (track_file is not None):
+        track_file.close()
+
+    # line buffered so each point is still written right away
+    track_file = open(os.path.join("tracking", fileName), 'a', buffering=1)
+
 def new_track_file(tm: datetime.datetime, tmz: str) -> None:
     global fileName
 
@@ -142,17 +216,20 @@ def new_track_file(tm: datetime.datetime, tmz: str) -> None:
     fileName = datetime.datetime.strftime(n_tm, "%Y-%m-%d_%H:%M:%S_track_path")
 
     print(f"creating new track file with time: {fileName}")
+    _open_track_file()
 
 
 def tracker(lat: int, lng: int, tm: datetime.datetime) -> None:
-    global tracking, fileName, prevTimeEpoch, msg
+    global tracking, fileName, prevTimeNs, msg, track_file
 
     # makes sure doesn't print "PAUSED" multiple times
     # print coordinates every 2 seconds
-    if (tracking == 0 or (tracking == 1 and msg.strip().upper() == "PAUSED") or math.floor(time.time())-prevTimeEpoch < INTERVAL):
+    # monotonic so it does not break if the system time changes
+    now_ns = time.monotonic_ns()
+    if (tracking == 0 or (tracking == 1 and msg.strip().upper() == "PAUSED") or now_ns-prevTimeNs < INTERVAL_NS):
         return
     else:
-        prevTimeEpoch = math.floor(time.time())
+        prevTimeNs = now_ns
 
     if (tracking == 1):
         msg = "PAUSED\n"
@@ -161,21 +238,54 @@ def tracker(lat: int, lng: int, tm: datetime.datetime) -> None:
 
     print(f"writing {msg[:-1]} to {fileName}")
 
-    with open(os.path.join("tracking", fileName), 'a') as f:
-        f.write(msg)
+    # tracking can start without a new file if button was pressed while GPS was disconnected
+    if (track_file is None):
+        _open_track_file()
+
+    track_file.write(msg)
+
 
+# m/s multiplied by these to get mph, km/h, m/s
+_SCALE = (2.237, 3.6, 1.0)
+_UNIT_TO_STR = ("mph", "km/h", "m/s")
 
 def conv_unit(val: int, unit: int) -> int:
     # given in m/s
 
+    # only checked when not running with -O
     assert(isinstance(unit, int) and unit >= 0 and unit < 3)
 
-    if (unit == 0): # mph
-        return int((val/1.0)*2.237)
-    elif (unit == 1): # km/h
-        return int((val/1.0)*3.6)
-    else: # m/s
-        return int(val)
+    return int(val*_SCALE[unit])
+
+
+@functools.lru_cache(maxsize=64)
+def _glyph(text: str, font: ImageFont.ImageFont) -> Image.Image:
+    """
+    Renders text once into its own 1-bit image so it can be pasted onto the frame
+    """
+
+    _, _, w, h = font.getbbox(text)
+    im = Image.new('1', (max(w, 1), max(h, 1)))
+    ImageDraw.Draw(im).text((0, 0), text, font=font, fill=255)
+    return im
+
+
+@functools.lru_cache(maxsize=8)
+def _fmt_dt(y: int, mo: int, d: int, h: int, mi: int, fmt: str) -> str:
+    # displayed time only changes every minute, so only format it once a minute
+    return datetime.datetime(y, mo, d, h, mi).strftime(fmt)
+
+
+def _to_oled_buffer(img: Image.Image) -> "list[int]":
+    """
+    Packs a 128x64 1-bit image into SSD1306 page order using numpy,
+    instead of Adafruit_SSD1306's per-pixel loop in image()
+    """
+
+    # rows are split into 8 pages of 8 pixels, each column of a page is one byte with the top pixel as LSB
+    pix = np.asarray(img, dtype=bool).reshape(8, 8, 128).transpose(0, 2, 1)
+    # bits are reversed instead of using bitorder="little", which needs numpy 1.17+
+    return np.packbits(pix[..., ::-1], axis=-1).ravel().tolist()
 
 
 def draw_on_display(disp: Adafruit_SSD1306.SSD1306_128_64, img: Image.Image,
@@ -192,47 +302,44 @@ def draw_on_display(disp: Adafruit_SSD1306.SSD1306_128_64, img: Image.Image,
         refer to plan doc for what each means
     }
     """
-    global oled_speed
-
-    unit_to_str = ["mph", "km/h", "m/s"]
+    global oled_speed, last_frame, last_frame_time
 
     mode_font = fonts[0]
     sp_font = fonts[1]
     unit_font = fonts[2]
     track_font = fonts[3]
 
-    # dd-mm or mm-dd
-    dayfmt = "%m/%d "
-    if (cfg["DTM"] == 1):
-        dayfmt = "%d-%m "
-
-    # date_x is to shift to account for lack of AM/PM
-    # 23:00 or 11:00PM
-    tmfmt = "%I:%M%p"
-    date_x = 30
-    if (cfg["24H"] == 1):
-        date_x = 40
-        tmfmt = "%H:%M"
-
     # conv all to disp strings
     disp_speed = str(conv_unit(data["speed"], int(data["unit"])))
-    disp_dt = str(datetime.datetime.strftime(data["datetime"], dayfmt + tmfmt))
+    dt = data["datetime"]
+    disp_dt = _fmt_dt(dt.year, dt.month, dt.day, dt.hour, dt.minute, _DTFMT)
     disp_mode = "M:" + str(data["mode"])
-    disp_unit = str(unit_to_str[data["unit"]])
+    disp_unit = _UNIT_TO_STR[data["unit"]]
     disp_track = str(data["track"])
 
     # draw black rectangle the size of screen to clear the screen
     drawing.rectangle((0, 0, 128, 128), fill=0)
 
-    drawing.text((0, 0), disp_mode, font=mode_font, fill=255)
-    drawing.text((date_x, 0), disp_dt, font=mode_font, fill=255)
-    drawing.text((0, 16), disp_speed, font=sp_font, fill=255)
-    drawing.text((84, 16), disp_unit, font=unit_font, fill=255)
-    drawing.text((84, 48), disp_track, font=track_font, fill=255)
+    # text that rarely changes is rendered once and pasted, using itself as mask so it doesn't cover other text
+    mode_glyph = _glyph(disp_mode, mode_font)
+    unit_glyph = _glyph(disp_unit, unit_font)
+    track_glyph = _glyph(disp_track, track_font)
 
-    disp.image(img)
+    img.paste(mode_glyph, (0, 0), mode_glyph)
+    drawing.text((_DATE_X, 0), disp_dt, font=mode_font, fill=255)
+    drawing.text((0, 16), disp_speed, font=sp_font, fill=255)
+    img.paste(unit_glyph, (84, 16), unit_glyph)
+    img.paste(track_glyph, (84, 48), track_glyph)
+
+    # only send frame over I2C if it changed or has not been sent for a while
+    frame = img.tobytes()
+    now = time.monotonic()
+    if (frame != last_frame or now-last_frame_time >= FRAME_REFRESH):
+        disp._buffer = _to_oled_buffer(img)
+        disp.display()
+        last_frame = frame
+        last_frame_time = now
 
-    disp.display()
     time.sleep(0.2)
 
     # this is the speed currently displayed on the oled
@@ -273,26 +380,27 @@ def disp_th() -> None:
 def main_ser_connect(ser: serial.Serial) -> None:
     global cfg_ard, send, curdata, tracking, prevbstate1, prevbstate2, disp_data_g, cur_tz, oled_speed, wastracking
 
+    # last time string received from GPS and its parsed value
+    last_tstr = ""
+    last_tm = None
+
     while True:
         while (ser.is_open):
             # what to put onto display
-            display_dict = {
-                "speed": 0,
-                "unit": cfg_ard["UNT"],
-                "datetime": datetime.datetime(1970, 1, 1, 0, 0, 0),
-                "mode": 'D',
-                "track": ''
-            }
+            # new dict each loop since the OLED thread reads the previous one
+            display_dict = _DISPLAY_TEMPLATE.copy()
 
             # get data from Arduino
+            # blocks until a line arrives or the serial timeout passes, returns b"" on timeout
             rcv = {}
-            if (ser.in_waiting):
-                temp = ser.readline()
-                if (temp != b"\r\n"):
-                    rcv = json.loads(temp.decode('utf-8').rstrip())
+            temp = ser.readline()
+            if (temp.strip()):
+                rcv = _loads(temp)
 
             # get data from curdata (from thread) and alter send
-            if ("mode" not in curdata or curdata["mode"] < 2):
+            # use one snapshot for the whole loop since the GPS thread can replace curdata at any time
+            gps_data = curdata
+            if ("mode" not in gps_data or gps_data["mode"] < 2):
                 # disconnected
                 send["GPS"] = [-1]*6
                 send["LED"][1] = 2
@@ -307,20 +415,24 @@ def main_ser_connect(ser: serial.Serial) -> None:
                     tracking = 2
 
                 # time
-                curtime = curdata["time"]
-                d_localized = _conv_tmz(curtime[:-5], "%Y-%m-%dT%H:%M:%S", cur_tz)
+                # only parse time again if GPS sent a new one since strptime is slow
+                curtime = gps_data["time"]
+                if (curtime != last_tstr):
+                    last_tm = datetime.datetime.strptime(curtime[:-5], "%Y-%m-%dT%H:%M:%S")
+                    last_tstr = curtime
+                d_localized = _conv_tmz(last_tm, None, cur_tz)
 
                 # speed, given in m/s
-                speed = curdata["speed"]
+                speed = gps_data["speed"]
 
                 # send speed currently displayed on oled to panel so it is synced with oled
-                send["GPS"] = [curdata["lat"], curdata["lon"], conv_unit(oled_speed, unit=display_dict["unit"]),
+                send["GPS"] = [gps_data["lat"], gps_data["lon"], conv_unit(oled_speed, unit=display_dict["unit"]),
                                d_localized.month, d_localized.day, d_localized.hour, d_localized.minute]
 
                 # update what to display
                 t = ['', 'P', 'T']
                 display_dict["speed"] = speed
-                display_dict["mode"] = curdata["mode"]
+                display_dict["mode"] = gps_data["mode"]
                 display_dict["datetime"] = d_localized
                 display_dict["track"] = t[tracking]
 
@@ -337,9 +449,7 @@ def main_ser_connect(ser: serial.Serial) -> None:
                     # create new file when button pressed
                     if (send["LED"][1] == 0):
                         wastracking = True
-                        tm = datetime.datetime.strptime(
-                            curdata["time"][:-5], "%Y-%m-%dT%H:%M:%S")
-                        new_track_file(tm, cur_tz)
+                        new_track_file(last_tm, cur_tz)
 
             # if button 2 pressed
             if ("BUTTON2" in rcv and rcv["BUTTON2"] and not prevbstate2 and tracking != 0):
@@ -355,14 +465,12 @@ def main_ser_connect(ser: serial.Serial) -> None:
             # put tracking to file
             # make sure there is data from GPS since red LED would be on if no data
             if (send["LED"][1] == 0):
-                tm = datetime.datetime.strptime(
-                    curdata["time"][:-5], "%Y-%m-%dT%H:%M:%S")
-                tracker(curdata["lat"], curdata["lon"], tm)
+                tracker(gps_data["lat"], gps_data["lon"], last_tm)
 
             # Process received data and prepare sending data
-            send_str = ""
+            send_bytes = b"\n"
             if ("REQ" in rcv and rcv["REQ"] == 0):
-                send_str = json.dumps(cfg_ard)
+                send_bytes = _CFG_ARD_JSON
             elif ("REQ" in rcv and rcv["REQ"] == 1):
                 # B1RCV/B2RCV alg
                 if (rcv["BUTTON1"]):
@@ -375,17 +483,15 @@ def main_ser_connect(ser: serial.Serial) -> None:
                 else:
                     send["B2RCV"] = False
 
-                send_str = json.dumps(send)
-
-            send_str += "\n"
+                send_bytes = _dumps(send) + b"\n"
 
             # print what was received and what we are sending (debug)
             # if (rcv != {}):
             #     print(f"received: {rcv}")
-            #     print(f"sending: {send_str}\n")
+            #     print(f"sending: {send_bytes}\n")
 
             # send data
-            ser.write(send_str.encode("utf-8"))
+            ser.write(send_bytes)
 
             # display on OLED
             disp_data_g = display_dict
@@ -393,8 +499,6 @@ def main_ser_connect(ser: serial.Serial) -> None:
             prevbstate1 = send["B1RCV"]
             prevbstate2 = send["B2RCV"]
 
-            time.sleep(0.01)
-
             assert(tracking < 3 and tracking >= 0)
 
         time.sleep(1)
@@ -417,7 +521,8 @@ def main() -> None:
     th2.start()
 
     # serial init
-    ser = serial.Serial(port, 115200, timeout=1,
+    # short timeout so the display still gets updated when the Arduino is silent
+    ser = serial.Serial(port, 115200, timeout=0.05,
                         stopbits=2, parity=serial.PARITY_NONE)
     ser.flush()
 
@@ -194,8 +194,12 @@ def delete_map_endpt(f_name):
 def check_for_update() -> None:
     global need_update, cur_version
 
-    response = requests.get("https://raw.githubusercontent.com/jonyboi396825/BikeDashboardPlus/master/VERSION")
-    need_update = not (response.text.strip() == cur_version)
+    # timeout so the server still starts if GitHub cannot be reached
+    try:
+        response = requests.get("https://raw.githubusercontent.com/jonyboi396825/BikeDashboardPlus/master/VERSION", timeout=2)
+        need_update = not (response.text.strip() == cur_version)
+    except requests.exceptions.RequestException:
+        need_update = False
 
 
 def main() -> None: